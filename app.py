@@ -1,11 +1,19 @@
 import streamlit as st
 import os
 import requests
-from src.document_processor import DocumentProcessor
-from src.ollama_analyzer import OllamaAnalyzer
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser is a drop-in fallback
+    import json
+    _json_loads = json.loads
+from src.ollama_analyzer import OllamaAnalyzer, create_session
 from src.privacy_utils import PrivacyManager
-import plotly.express as px
-import pandas as pd
+from src.privacy_config import PrivacyConfig
+from src.utils import generate_file_hash, cached_document_processing
 from datetime import datetime
 
 # Page config
@@ -16,21 +24,212 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def check_ollama_status():
-    """Check if Ollama is running"""
+OLLAMA_BASE_URL = "http://localhost:11434"
+
+# How long Ollama keeps the model loaded after a request. Every request resets the
+# timer to the value it sends, so the warm-up and the analyses must agree
+OLLAMA_KEEP_ALIVE_MINUTES = 30
+OLLAMA_KEEP_ALIVE = f"{OLLAMA_KEEP_ALIVE_MINUTES}m"
+
+# What each sanitization level does, and its display name
+SANITIZATION_INFO = {
+    "none": "No privacy filtering applied",
+    "low": "Basic filtering: obvious patterns only",
+    "medium": "Standard filtering: emails, phones, credit cards",
+    "high": "Aggressive filtering: names, addresses, SSNs, emails, phones, cards"
+}
+SANITIZATION_TITLES = {level: level.title() for level in SANITIZATION_INFO}
+
+# Streamed analysis sections, in generation order, with their display labels
+ANALYSIS_SECTIONS = {
+    "executive_summary": "Executive Summary",
+    "key_themes": "Key Themes",
+    "slide_headlines": "Slide Headlines",
+    "sentiment": "Sentiment",
+}
+
+# Shared across reruns by the warm-up and every analyzer, so their Ollama
+# calls reuse one keep-alive connection pool
+_OLLAMA_SESSION = create_session()
+# The sidebar status probe has its own session without retries, so a failing
+# server can't stall every rerun behind the backoff
+_PROBE_SESSION = create_session(pool_size=1, retry_busy=False)
+
+@st.cache_data(ttl=10, show_spinner=False)
+def ollama_tags():
+    """Installed Ollama models, or None if Ollama isn't reachable (probed at most once every 10 seconds)"""
+    try:
+        response = _PROBE_SESSION.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=0.5)
+        if not response.ok:
+            return None
+        return [model['name'] for model in _json_loads(response.content).get('models', [])]
+    except Exception:
+        return None
+
+def _warm_model(model: str) -> None:
+    """Ask Ollama to load a model (an empty prompt loads it without generating)"""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code == 200:
-            models_data = response.json()
-            available_models = [model['name'] for model in models_data.get('models', [])]
-            return True, available_models
-        return False, []
-    except:
-        return False, []
+        _OLLAMA_SESSION.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={"model": model, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE, "stream": False},
+            timeout=300
+        )
+    except requests.RequestException:
+        pass  # Best effort: the first analysis will load the model instead
+
+@st.cache_resource(ttl=(OLLAMA_KEEP_ALIVE_MINUTES - 5) * 60)
+def warm_ollama_model(model: str) -> threading.Thread:
+    """Preload the selected model in the background, renewed before its keep-alive lapses"""
+    thread = threading.Thread(target=_warm_model, args=(model,), daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def get_privacy_manager() -> PrivacyManager:
+    """Shared privacy manager; the storage directories are created once per process"""
+    storage_config = PrivacyConfig().config["storage"]
+    return PrivacyManager(compress_storage=storage_config.get("compress_storage", False),
+                          max_stored_analyses=storage_config.get("max_stored_analyses"))
+
+@st.cache_resource
+def get_ollama(model: str) -> OllamaAnalyzer:
+    """Shared Ollama analyzer per model, built once per process"""
+    return OllamaAnalyzer(model=model, base_url=OLLAMA_BASE_URL, session=_OLLAMA_SESSION,
+                          keep_alive=OLLAMA_KEEP_ALIVE)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_history(storage_version: tuple, _privacy_manager: PrivacyManager):
+    """Stored analysis history, re-read from disk only when the storage directories change"""
+    return _privacy_manager.load_analysis_history()
+
+def load_history(privacy_manager: PrivacyManager):
+    """Analysis history, keyed on the storage directories' mtimes so saves and deletions show up at once"""
+    return _load_history(privacy_manager.storage_version(), privacy_manager)
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Background workers for model inference, shared across sessions"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def _record_progress(progress: dict, section: str, value) -> None:
+    """Collect streamed analysis sections so the polling UI can show partial results"""
+    if section == "summary_token":
+        progress["summary"] = progress.get("summary", "") + value
+    else:
+        progress[section] = value
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _analyze_cached(doc_hash: str, sanitization_level: str, model: str, _document_data: dict, _progress: dict):
+    """Run the LLM analysis once per (document, sanitization level, model)
+    
+    Failed analyses raise instead of returning, so st.cache_data doesn't keep
+    serving the error after Ollama recovers.
+    """
+    analysis = get_ollama(model).analyze_document(
+        _document_data,
+        on_update=lambda section, value: _record_progress(_progress, section, value)
+    )
+    if analysis.error:
+        raise Exception(f"AI analysis failed: {analysis.error}")
+    return analysis
+
+@st.fragment
+def render_analysis(analysis, document_data: dict, selected_model: str, privacy_manager: PrivacyManager):
+    """Render the analysis tabs; button clicks inside rerun only this fragment"""
+    # Create tabs for results
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        "📝 Summary", 
+        "📋 Executive Summary", 
+        "🎯 Key Themes", 
+        "📊 Slide Headlines",
+        "📈 Analytics",
+        "🔒 Privacy Report"
+    ])
+    
+    with tab1:
+        st.subheader("Document Summary")
+        st.write(analysis.summary)
+        
+        if st.button("📋 Copy Summary", key="copy_summary"):
+            st.code(analysis.summary, language=None)
+    
+    with tab2:
+        st.subheader("Executive Summary")
+        st.write(analysis.executive_summary)
+        
+        if st.button("📋 Copy Executive Summary", key="copy_exec"):
+            st.code(analysis.executive_summary, language=None)
+    
+    with tab3:
+        st.subheader("Key Themes")
+        # One markdown block (hard line breaks) instead of one element per theme
+        st.markdown("  \n".join(f"**{i}.** {theme}" for i, theme in enumerate(analysis.key_themes, 1)))
+        
+        if st.button("📋 Copy Themes", key="copy_themes"):
+            themes_text = "\n".join(f"{i}. {theme}" for i, theme in enumerate(analysis.key_themes, 1))
+            st.code(themes_text, language=None)
+    
+    with tab4:
+        st.subheader("Suggested Slide Headlines")
+        st.markdown("  \n".join(f"**Slide {i}:** {headline}" for i, headline in enumerate(analysis.slide_headlines, 1)))
+        
+        if st.button("📋 Copy Headlines", key="copy_headlines"):
+            headlines_text = "\n".join(f"Slide {i}: {headline}" for i, headline in enumerate(analysis.slide_headlines, 1))
+            st.code(headlines_text, language=None)
+    
+    with tab5:
+        st.subheader("Document Analytics")
+        
+        # Static figures, so one markdown table instead of three st.metric elements
+        st.markdown(
+            "| Word Count | Themes Found | Headlines Generated | Document Sentiment |\n"
+            "|---|---|---|---|\n"
+            f"| {analysis.word_count:,} | {len(analysis.key_themes)} | {len(analysis.slide_headlines)} | {analysis.sentiment} |"
+        )
+        
+        # Reading time calculation
+        if analysis.word_count > 0:
+            reading_time = max(1, analysis.word_count // 200)
+            st.info(f"📖 Estimated reading time: {reading_time} minute(s)")
+        
+        # Model info
+        st.write(f"**AI Model Used:** {selected_model}")
+        st.write(f"**Processing Time:** {datetime.now().strftime('%H:%M:%S')}")
+    
+    with tab6:
+        st.subheader("🔒 Privacy & Security Report")
+        
+        # Privacy confirmation
+        st.success("✅ **Complete Privacy Maintained**")
+        
+        privacy_report_items = [
+            "🏠 All processing performed locally on your computer",
+            "🚫 No data transmitted to external servers", 
+            "🗑️ Temporary files automatically deleted",
+            "🧹 Memory cleared after processing",
+            "📁 Results stored locally only (if enabled)"
+        ]
+        
+        for item in privacy_report_items:
+            st.write(item)
+        
+        # Show sanitization report if applied
+        if 'sanitization_info' in document_data:
+            st.divider()
+            st.subheader("🛡️ Document Sanitization Report")
+            privacy_report = privacy_manager.get_privacy_report(
+                document_data['sanitization_info']
+            )
+            st.info(privacy_report)
+        
+        # Privacy settings export
+        if st.button("📤 Export Privacy Settings"):
+            privacy_settings = privacy_manager.export_privacy_settings()
+            st.json(privacy_settings)
 
 def main():
     # Initialize privacy manager
-    privacy_manager = PrivacyManager()
+    privacy_manager = get_privacy_manager()
     
     st.title("🔒 Private AI Document Analyzer")
     st.markdown("**Powered by Ollama** - Your documents never leave your computer!")
@@ -39,8 +238,12 @@ def main():
     with st.sidebar:
         st.header("🛡️ Privacy & Configuration")
         
-        # Ollama Status Check
-        ollama_running, available_models = check_ollama_status()
+        # Ollama Status Check (one /api/tags call gives both status and installed models)
+        if st.button("🔄 Refresh Ollama status"):
+            ollama_tags.clear()
+        tags = ollama_tags()
+        ollama_running = tags is not None
+        available_models = tags or []
         
         if ollama_running:
             st.success("✅ Ollama is running!")
@@ -52,6 +255,8 @@ def main():
                     available_models,
                     help="Choose which local AI model to use for analysis"
                 )
+                # Hide the cold model load before the user uploads anything
+                warm_ollama_model(selected_model)
             else:
                 st.warning("No models found. Please download a model first.")
                 selected_model = "llama3.1"  # Default fallback
@@ -66,6 +271,8 @@ def main():
             """)
             selected_model = "llama3.1"
         
+        model_available = not available_models or selected_model in available_models
+        
         st.divider()
         
         # Privacy Settings
@@ -75,7 +282,7 @@ def main():
         st.write("**Document Sanitization:**")
         sanitization_level = st.selectbox(
             "Sanitization Level",
-            ["none", "low", "medium", "high"],
+            list(SANITIZATION_INFO),
             index=2,  # Default to "medium"
             help="""
             • None: No sanitization
@@ -86,13 +293,7 @@ def main():
         )
         
         # Show what each level does
-        sanitization_info = {
-            "none": "No privacy filtering applied",
-            "low": "Basic filtering: obvious patterns only",
-            "medium": "Standard filtering: emails, phones, credit cards",
-            "high": "Aggressive filtering: names, addresses, SSNs, emails, phones, cards"
-        }
-        st.caption(sanitization_info[sanitization_level])
+        st.caption(SANITIZATION_INFO[sanitization_level])
         
         # Local Storage Options
         st.write("**Local Storage:**")
@@ -101,7 +302,7 @@ def main():
         
         if save_analysis:
             # Show storage info
-            analyses_count = len(privacy_manager.load_analysis_history())
+            analyses_count = len(load_history(privacy_manager))
             st.caption(f"💾 {analyses_count} previous analyses stored")
         
         st.divider()
@@ -141,7 +342,7 @@ def main():
         
         if uploaded_file:
             st.success(f"✅ File: {uploaded_file.name}")
-            file_size = len(uploaded_file.getvalue())
+            file_size = uploaded_file.size
             st.info(f"📊 Size: {file_size / 1024:.1f} KB")
             
             # Privacy assurance
@@ -149,17 +350,19 @@ def main():
             
             # Show what will be sanitized
             if sanitization_level != "none":
-                st.info(f"🛡️ **Protection Level**: {sanitization_level.title()}\n{sanitization_info[sanitization_level]}")
+                st.info(f"🛡️ **Protection Level**: {SANITIZATION_TITLES[sanitization_level]}\n{SANITIZATION_INFO[sanitization_level]}")
     
     with col2:
         st.header("📊 Document Analysis")
         
         if uploaded_file and ollama_running:
-            # Process document with privacy features
-            processor = DocumentProcessor(enable_privacy=True)
+            # Zero-copy view of the upload, reused for hashing and processing
+            file_data = uploaded_file.getbuffer()
+            doc_hash = generate_file_hash(file_data)
             
+            # Process document with privacy features
             with st.spinner("🔒 Processing document locally with privacy protection..."):
-                document_data = processor.process_document(uploaded_file, sanitization_level)
+                document_data = cached_document_processing(doc_hash, file_data, uploaded_file.name, sanitization_level)
             
             if document_data:
                 st.success("✅ Document processed successfully!")
@@ -180,7 +383,7 @@ def main():
                     if 'sanitization_info' in document_data:
                         sanitization_data = document_data['sanitization_info']
                         st.write("**Privacy Protection Applied:**")
-                        st.write(f"- Sanitization Level: {sanitization_data['sanitization_level'].title()}")
+                        st.write(f"- Sanitization Level: {SANITIZATION_TITLES[sanitization_data['sanitization_level']]}")
                         st.write(f"- Original Length: {sanitization_data['original_length']:,} chars")
                         st.write(f"- Processed Length: {sanitization_data['sanitized_length']:,} chars")
                         
@@ -192,116 +395,63 @@ def main():
                                     st.write(f"  - {item_type.title()}: {count}")
                 
                 # AI Analysis
-                if selected_model in [m for m in available_models] if available_models else [selected_model]:
-                    analyzer = OllamaAnalyzer(model=selected_model)
-                    
-                    # Perform analysis
-                    analysis = analyzer.analyze_document(document_data)
-                    
-                    # Save analysis locally if enabled
-                    if save_analysis:
-                        save_path = privacy_manager.save_analysis_locally(
-                            analysis, 
-                            uploaded_file.name,
-                            document_data.get('sanitization_info')
-                        )
-                        if save_path:
-                            st.success(f"💾 Analysis saved locally (private storage)")
-                    
-                    # Create tabs for results
-                    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-                        "📝 Summary", 
-                        "📋 Executive Summary", 
-                        "🎯 Key Themes", 
-                        "📊 Slide Headlines",
-                        "📈 Analytics",
-                        "🔒 Privacy Report"
-                    ])
-                    
-                    with tab1:
-                        st.subheader("Document Summary")
-                        st.write(analysis.summary)
-                        
-                        if st.button("📋 Copy Summary", key="copy_summary"):
-                            st.code(analysis.summary, language=None)
-                    
-                    with tab2:
-                        st.subheader("Executive Summary")
-                        st.write(analysis.executive_summary)
-                        
-                        if st.button("📋 Copy Executive Summary", key="copy_exec"):
-                            st.code(analysis.executive_summary, language=None)
-                    
-                    with tab3:
-                        st.subheader("Key Themes")
-                        for i, theme in enumerate(analysis.key_themes, 1):
-                            st.write(f"**{i}.** {theme}")
-                        
-                        themes_text = "\n".join([f"{i}. {theme}" for i, theme in enumerate(analysis.key_themes, 1)])
-                        if st.button("📋 Copy Themes", key="copy_themes"):
-                            st.code(themes_text, language=None)
-                    
-                    with tab4:
-                        st.subheader("Suggested Slide Headlines")
-                        for i, headline in enumerate(analysis.slide_headlines, 1):
-                            st.write(f"**Slide {i}:** {headline}")
-                        
-                        headlines_text = "\n".join([f"Slide {i}: {headline}" for i, headline in enumerate(analysis.slide_headlines, 1)])
-                        if st.button("📋 Copy Headlines", key="copy_headlines"):
-                            st.code(headlines_text, language=None)
-                    
-                    with tab5:
-                        st.subheader("Document Analytics")
-                        
-                        col_a, col_b, col_c = st.columns(3)
-                        with col_a:
-                            st.metric("Word Count", f"{analysis.word_count:,}")
-                        with col_b:
-                            st.metric("Themes Found", len(analysis.key_themes))
-                        with col_c:
-                            st.metric("Headlines Generated", len(analysis.slide_headlines))
-                        
-                        st.write(f"**Document Sentiment:** {analysis.sentiment}")
-                        
-                        # Reading time calculation
-                        if analysis.word_count > 0:
-                            reading_time = max(1, analysis.word_count // 200)
-                            st.info(f"📖 Estimated reading time: {reading_time} minute(s)")
-                        
-                        # Model info
-                        st.write(f"**AI Model Used:** {selected_model}")
-                        st.write(f"**Processing Time:** {datetime.now().strftime('%H:%M:%S')}")
-                    
-                    with tab6:
-                        st.subheader("🔒 Privacy & Security Report")
-                        
-                        # Privacy confirmation
-                        st.success("✅ **Complete Privacy Maintained**")
+                if model_available:
+                    # Reuse this session's last analysis on reruns (tab switches, Copy buttons)
+                    analysis_key = (doc_hash, sanitization_level, selected_model)
+                    if st.session_state.get("analysis_key") == analysis_key:
+                        analysis = st.session_state["analysis"]
+                    else:
+                        # Run inference off the script thread and poll so the UI stays responsive
+                        if st.session_state.get("pending_key") != analysis_key:
+                            st.session_state["pending_key"] = analysis_key
+                            st.session_state["pending_progress"] = {}
+                            st.session_state["pending_analysis"] = get_executor().submit(
+                                _analyze_cached, doc_hash, sanitization_level, selected_model,
+                                document_data, st.session_state["pending_progress"]
+                            )
                         
-                        privacy_report_items = [
-                            "🏠 All processing performed locally on your computer",
-                            "🚫 No data transmitted to external servers", 
-                            "🗑️ Temporary files automatically deleted",
-                            "🧹 Memory cleared after processing",
-                            "📁 Results stored locally only (if enabled)"
-                        ]
+                        future = st.session_state["pending_analysis"]
+                        if not future.done():
+                            st.info(f"🤖 Generating AI analysis using {selected_model}...")
+                            
+                            # Show sections as they stream in
+                            progress = st.session_state["pending_progress"]
+                            if progress.get("summary"):
+                                st.subheader("Document Summary")
+                                st.write(progress["summary"])
+                            completed = [label for section, label in ANALYSIS_SECTIONS.items() if section in progress]
+                            if completed:
+                                st.caption("✅ Ready: " + ", ".join(completed))
+                            
+                            time.sleep(0.5)
+                            st.rerun()
                         
-                        for item in privacy_report_items:
-                            st.write(item)
+                        st.session_state.pop("pending_key")
+                        st.session_state.pop("pending_progress")
+                        st.session_state.pop("pending_analysis")
+                        try:
+                            analysis = future.result()
+                        except Exception as e:
+                            # Dropping the pending job lets the next rerun retry instead of re-raising
+                            analysis = None
+                            st.error(f"❌ Error analyzing document: {str(e)}")
+                        else:
+                            st.session_state["analysis_key"] = analysis_key
+                            st.session_state["analysis"] = analysis
                         
-                        # Show sanitization report if applied
-                        if 'sanitization_info' in document_data:
-                            st.divider()
-                            st.subheader("🛡️ Document Sanitization Report")
-                            privacy_report = privacy_manager.get_privacy_report(
-                                document_data['sanitization_info']
+                        # Save analysis locally if enabled (once per new analysis)
+                        if analysis and save_analysis:
+                            save_path = privacy_manager.save_single_analysis(
+                                analysis, 
+                                uploaded_file.name,
+                                document_data.get('sanitization_info')
                             )
-                            st.info(privacy_report)
-                        
-                        # Privacy settings export
-                        if st.button("📤 Export Privacy Settings"):
-                            privacy_settings = privacy_manager.export_privacy_settings()
-                            st.json(privacy_settings)
+                            if save_path:
+                                _load_history.clear()
+                                st.success(f"💾 Analysis saved locally (private storage)")
+                    
+                    if analysis:
+                        render_analysis(analysis, document_data, selected_model, privacy_manager)
                 else:
                     st.error(f"Selected model '{selected_model}' is not available. Please download it first.")
         
@@ -321,7 +471,7 @@ def main():
     if save_analysis:
         st.divider()
         with st.expander("📚 Analysis History", expanded=False):
-            history = privacy_manager.load_analysis_history()
+            history = load_history(privacy_manager)
             
             if history:
                 st.write(f"**{len(history)} previous analyses found:**")
@@ -1,62 +1,131 @@
+import os
 import requests
 import json
-from typing import Dict, List
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import streamlit as st
 import re
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from src.ollama_analyzer import AnalysisResult
 
-@dataclass
-class AnalysisResult:
-    summary: str
-    executive_summary: str
-    key_themes: List[str]
-    slide_headlines: List[str]
-    word_count: int
-    sentiment: str
+# (base_url, model) pairs already confirmed available; only successes are
+# remembered so a server started later is still picked up
+_CONNECTED_MODELS: Set[Tuple[str, str]] = set()
+
+_WORD_RE = re.compile(r'\S+')
+
+def chunk_text(text: str, max_chunk_size: int = 4000) -> List[str]:
+    """Split text into chunks of at most max_chunk_size characters, breaking at whitespace
+    
+    Scans offsets and slices the original string instead of splitting it into
+    words and re-joining them.
+    """
+    chunks = []
+    start, length = 0, len(text)
+    
+    while start < length:
+        end = min(start + max_chunk_size, length)
+        if end < length:
+            cut = max(text.rfind(' ', start, end), text.rfind('\n', start, end))
+            if cut > start:
+                end = cut
+        
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    
+    return chunks
+
+# Requests allowed in flight at once. Ollama runs one generation per model at a time
+# unless the server is started with OLLAMA_NUM_PARALLEL, so extra requests from the
+# map-reduce fan-out wait here rather than piling up on the server and timing out
+_OLLAMA_SLOTS = threading.BoundedSemaphore(max(1, int(os.getenv("OLLAMA_PARALLEL", "1"))))
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _cached_generate(api_url: str, payload_json: str, _session: requests.Session) -> str:
+    """POST a generate request, memoized on the exact model, prompt and options
+    
+    Raises on failure so that errors are never cached.
+    """
+    parts = []
+    with _OLLAMA_SLOTS, _session.post(
+        api_url,
+        data=payload_json,
+        headers={"Content-Type": "application/json"},
+        timeout=120,  # Longer timeout for local processing
+        stream=True
+    ) as response:
+        if response.status_code != 200:
+            raise Exception(f"Ollama API error: {response.status_code}")
+        
+        # Decode each streamed chunk as it arrives instead of waiting for the whole body
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise Exception(f"Ollama generation error: {chunk['error']}")
+            parts.append(chunk.get('response', ''))
+            if chunk.get('done'):
+                break
+    
+    return ''.join(parts).strip()
 
 class OllamaAnalyzer:
-    def __init__(self, model: str = "llama3.1", base_url: str = "http://localhost:11434"):
+    # A numbered or bulleted list line ("1. item", "- item", "• item"), capturing the item text
+    _LIST_ITEM = re.compile(r'^[^\S\n]*(?:\d+\.?|[-•])[^\S\n]*[-•]?[^\S\n]*(.*?)[^\S\n]*$', re.MULTILINE)
+    
+    def __init__(self, model: str = "llama3.1", base_url: str = "http://localhost:11434",
+                 session: Optional[requests.Session] = None):
         self.model = model
         self.base_url = base_url
         self.api_url = f"{base_url}/api/generate"
+        # Pooled keep-alive connections instead of a new TCP connect per call
+        self.session = session or requests.Session()
+    
+    def _executor(self, max_workers: int) -> ThreadPoolExecutor:
+        """Thread pool whose workers share the script context, so st.error/st.spinner still work"""
+        ctx = get_script_run_ctx()
+        return ThreadPoolExecutor(max_workers=max_workers, initializer=add_script_run_ctx, initargs=(None, ctx))
     
     def test_connection(self) -> bool:
         """Test if Ollama is running and model is available"""
+        if (self.base_url, self.model) in _CONNECTED_MODELS:
+            return True
+        
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
+            response = self.session.get(f"{self.base_url}/api/tags")
             if response.status_code == 200:
                 models = response.json()
                 available_models = [model['name'] for model in models.get('models', [])]
-                return self.model in available_models
+                if self.model in available_models:
+                    _CONNECTED_MODELS.add((self.base_url, self.model))
+                    return True
             return False
         except Exception as e:
             st.error(f"Cannot connect to Ollama: {str(e)}")
             return False
     
-    def generate_response(self, prompt: str, max_tokens: int = 500) -> str:
+    def generate_response(self, prompt: str, max_tokens: int = 500, response_format: Optional[str] = None) -> str:
         """Generate response using Ollama"""
         try:
             payload = {
                 "model": self.model,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
+                "keep_alive": "10m",
                 "options": {
                     "temperature": 0.7,
                     "num_predict": max_tokens
                 }
             }
+            if response_format:
+                payload["format"] = response_format
             
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                timeout=120  # Longer timeout for local processing
-            )
-            
-            if response.status_code == 200:
-                return response.json()['response'].strip()
-            else:
-                st.error(f"Ollama API error: {response.status_code}")
-                return "Error generating response"
+            # Identical prompts for the same model are answered from the cache on reruns
+            return _cached_generate(self.api_url, json.dumps(payload, sort_keys=True), self.session)
                 
         except Exception as e:
             st.error(f"Error calling Ollama: {str(e)}")
@@ -64,44 +133,65 @@ class OllamaAnalyzer:
     
     def chunk_text(self, text: str, max_chunk_size: int = 4000) -> List[str]:
         """Split text into manageable chunks"""
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
+        return chunk_text(text, max_chunk_size)
+    
+    def _parse_list_items(self, response: str) -> List[str]:
+        """Pull the items out of a numbered or bulleted list response"""
+        # One multiline scan of the whole response; filter out very short items
+        return [item for item in self._LIST_ITEM.findall(response) if len(item) > 5]
+    
+    def _parse_json_list(self, response: str, key: str) -> List[str]:
+        """Read a JSON-mode list response, falling back to list-line parsing"""
+        try:
+            items = json.loads(response).get(key)
+        except (json.JSONDecodeError, AttributeError):
+            items = None
         
-        for word in words:
-            if current_size + len(word) > max_chunk_size and current_chunk:
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_size = len(word)
-            else:
-                current_chunk.append(word)
-                current_size += len(word) + 1
+        if not isinstance(items, list):
+            return self._parse_list_items(response)
+        return [str(item).strip() for item in items if str(item).strip()]
+    
+    def _map_reduce(self, text: str, build_prompt: Callable[[str], str], max_tokens: int,
+                    chunk_size: int = 6000, response_format: Optional[str] = None) -> str:
+        """Run a prompt over the whole document instead of truncating it
         
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+        Text that fits in one chunk is answered directly. Longer text is split,
+        each chunk is answered in parallel, and the partial answers are fed back
+        through the same prompt until they fit in a single call.
+        """
+        if len(text) <= chunk_size:
+            return self.generate_response(build_prompt(text), max_tokens=max_tokens, response_format=response_format)
         
-        return chunks
+        chunks = self.chunk_text(text, chunk_size)
+        with self._executor(max_workers=4) as executor:
+            partials = list(executor.map(
+                lambda chunk: self.generate_response(build_prompt(chunk), max_tokens=max_tokens,
+                                                     response_format=response_format),
+                chunks
+            ))
+        
+        merged = "\n\n".join(f"Part {i}:\n{partial}" for i, partial in enumerate(partials, 1))
+        if len(merged) >= len(text):
+            # The partial answers didn't shrink the input; merge what fits instead of recursing
+            merged = merged[:chunk_size]
+        return self._map_reduce(merged, build_prompt, max_tokens, chunk_size, response_format)
     
     def generate_summary(self, text: str, max_length: int = 300) -> str:
         """Generate document summary"""
-        # Truncate text to fit context window
-        text_chunk = text[:6000]  # Conservative limit for local models
-        
-        prompt = f"""Please provide a comprehensive summary of the following document in approximately {max_length} words. Focus on the main points, key findings, and important conclusions.
+        def build_prompt(text_chunk: str) -> str:
+            return f"""Please provide a comprehensive summary of the following document in approximately {max_length} words. Focus on the main points, key findings, and important conclusions.
 
 Document:
 {text_chunk}
 
 Summary:"""
         
-        return self.generate_response(prompt, max_tokens=max_length + 50)
+        return self._map_reduce(text, build_prompt, max_tokens=max_length + 50)
     
     def generate_executive_summary(self, text: str) -> str:
         """Generate executive summary"""
-        text_chunk = text[:6000]
-        
-        prompt = f"""Create a concise executive summary of the following document. Focus on:
+        def build_prompt(text_chunk: str) -> str:
+            return f"""Create a concise executive summary of the following document. Focus on:
 - Key business insights
 - Main recommendations  
 - Critical findings
@@ -114,60 +204,38 @@ Document:
 
 Executive Summary:"""
         
-        return self.generate_response(prompt, max_tokens=200)
+        return self._map_reduce(text, build_prompt, max_tokens=200)
     
     def extract_key_themes(self, text: str, num_themes: int = 5) -> List[str]:
         """Extract key themes from document"""
-        text_chunk = text[:6000]
-        
-        prompt = f"""Analyze the following document and identify the {num_themes} most important themes or topics. Return only the themes as a numbered list, one theme per line.
+        def build_prompt(text_chunk: str) -> str:
+            return f"""Analyze the following document and identify the {num_themes} most important themes or topics.
 
 Document:
 {text_chunk}
 
-Key Themes:
-1."""
-        
-        response = self.generate_response(prompt, max_tokens=300)
+Respond with JSON: {{"themes": ["...", "..."]}}"""
         
-        # Extract themes from response
-        themes = []
-        lines = response.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line and (line.startswith(tuple('123456789')) or line.startswith('-') or line.startswith('•')):
-                # Clean up the theme text
-                theme = re.sub(r'^\d+\.?\s*[-•]?\s*', '', line)
-                if theme and len(theme) > 5:  # Filter out very short themes
-                    themes.append(theme)
+        # JSON mode constrains the model to a parseable list instead of free-form numbering
+        themes = self._parse_json_list(
+            self._map_reduce(text, build_prompt, max_tokens=300, response_format="json"), 'themes'
+        )
         
         return themes[:num_themes] if themes else ["Could not extract themes"]
     
     def suggest_slide_headlines(self, text: str, num_slides: int = 6) -> List[str]:
         """Generate slide headlines based on content"""
-        text_chunk = text[:6000]
-        
-        prompt = f"""Based on the following document, suggest {num_slides} compelling slide headlines for a presentation. Make them engaging, clear, and presentation-ready. Return only the headlines as a numbered list.
+        def build_prompt(text_chunk: str) -> str:
+            return f"""Based on the following document, suggest {num_slides} compelling slide headlines for a presentation. Make them engaging, clear, and presentation-ready.
 
 Document:
 {text_chunk}
 
-Slide Headlines:
-1."""
+Respond with JSON: {{"headlines": ["...", "..."]}}"""
         
-        response = self.generate_response(prompt, max_tokens=300)
-        
-        # Extract headlines from response
-        headlines = []
-        lines = response.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line and (line.startswith(tuple('123456789')) or line.startswith('-') or line.startswith('•')):
-                headline = re.sub(r'^\d+\.?\s*[-•]?\s*', '', line)
-                if headline and len(headline) > 5:
-                    headlines.append(headline)
+        headlines = self._parse_json_list(
+            self._map_reduce(text, build_prompt, max_tokens=300, response_format="json"), 'headlines'
+        )
         
         return headlines[:num_slides] if headlines else ["Could not generate headlines"]
     
@@ -184,10 +252,50 @@ Sentiment Analysis:"""
         
         return self.generate_response(prompt, max_tokens=100)
     
+    def analyze_all(self, text: str) -> Optional[Dict]:
+        """Run all five analyses in one JSON-mode call; returns None if the reply can't be used"""
+        prompt = f"""Analyze the following document. Provide:
+- summary: a comprehensive summary of about 300 words covering the main points, key findings and conclusions
+- executive_summary: a concise, action-oriented executive summary of at most 150 words
+- key_themes: the 5 most important themes or topics
+- slide_headlines: 6 compelling, presentation-ready slide headlines
+- sentiment: Positive, Negative, Neutral or Mixed, with a 1-2 sentence explanation
+
+Document:
+{text}
+
+Respond with JSON: {{"summary":"...","executive_summary":"...","key_themes":["..."],"slide_headlines":["..."],"sentiment":"..."}}"""
+        
+        try:
+            result = json.loads(self.generate_response(prompt, max_tokens=1000, response_format="json"))
+        except json.JSONDecodeError:
+            return None
+        
+        if not isinstance(result, dict):
+            return None
+        
+        def text_list(value) -> List[str]:
+            # A string or number here would otherwise be iterated per character or raise
+            return [str(item).strip() for item in value if str(item).strip()] if isinstance(value, list) else []
+        
+        themes = text_list(result.get('key_themes'))
+        headlines = text_list(result.get('slide_headlines'))
+        if not (result.get('summary') and result.get('executive_summary') and result.get('sentiment') and themes and headlines):
+            return None
+        
+        return {
+            'summary': str(result['summary']).strip(),
+            'executive_summary': str(result['executive_summary']).strip(),
+            'key_themes': themes[:5],
+            'slide_headlines': headlines[:6],
+            'sentiment': str(result['sentiment']).strip()
+        }
+    
     def analyze_document(self, document_data: Dict) -> AnalysisResult:
         """Main analysis method"""
         text = document_data.get('text', '')
-        word_count = len(text.split())
+        # Count words without materializing the word list
+        word_count = sum(1 for _ in _WORD_RE.finditer(text))
         
         if not self.test_connection():
             st.error(f"Cannot connect to Ollama or model '{self.model}' not found. Please ensure Ollama is running and the model is installed.")
@@ -201,12 +309,22 @@ Sentiment Analysis:"""
             )
         
         with st.spinner(f"Generating AI analysis using {self.model}..."):
-            # Generate all analyses
-            summary = self.generate_summary(text)
-            executive_summary = self.generate_executive_summary(text)
-            key_themes = self.extract_key_themes(text)
-            slide_headlines = self.suggest_slide_headlines(text)
-            sentiment = self.analyze_sentiment(text)
+            # Short documents fit in one prompt, so ask for all five analyses at once
+            combined = self.analyze_all(text) if len(text) <= 6000 else None
+            if combined:
+                return AnalysisResult(word_count=word_count, **combined)
+            
+            # The five analyses are independent, so submit them all before waiting on any
+            with self._executor(max_workers=5) as executor:
+                summary = executor.submit(self.generate_summary, text)
+                executive_summary = executor.submit(self.generate_executive_summary, text)
+                key_themes = executor.submit(self.extract_key_themes, text)
+                slide_headlines = executor.submit(self.suggest_slide_headlines, text)
+                sentiment = executor.submit(self.analyze_sentiment, text)
+            
+            summary, executive_summary, key_themes, slide_headlines, sentiment = (
+                future.result() for future in (summary, executive_summary, key_themes, slide_headlines, sentiment)
+            )
         
         return AnalysisResult(
             summary=summary,
@@ -1,52 +1,128 @@
 # src/document_processor.py - Enhanced version for multiple files
+import io
 import os
-import tempfile
-from typing import Dict, Any, List
-import PyPDF2
-import docx
-from pptx import Presentation
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Any, List, Optional, Tuple
 import re
 from datetime import datetime
 
+# The format libraries are imported by the extractors that need them, so an app that
+# only ever sees one format doesn't load the others (python-pptx pulls in lxml and Pillow).
+# pypdfium2 is optional; PyPDF2 is the fallback
+_HAS_PDFIUM = importlib.util.find_spec("pypdfium2") is not None
+
+_EMAIL = (re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'), '[EMAIL]', 'emails')
+_PHONE = (re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'), '[PHONE]', 'phone_numbers')
+_CREDIT_CARD = (re.compile(r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b'), '[CREDIT_CARD]', 'credit_cards')
+_SSN = (re.compile(r'\b\d{3}[-.]?\d{2}[-.]?\d{4}\b'), '[SSN]', 'ssns')
+_NAME = (re.compile(r'\b[A-Z][a-z]+ [A-Z][a-z]+\b'), '[NAME]', 'names')  # Simple name pattern
+_ADDRESS = (re.compile(r'\b\d+\s+[A-Za-z\s]+(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln)\b'), '[ADDRESS]', 'addresses')
+
+# Sanitization level -> (compiled pattern, replacement, category), applied in order
+_SANITIZATION_PATTERNS = {
+    # Basic sanitization - only obvious patterns
+    'low': [_CREDIT_CARD, _PHONE],
+    # Standard sanitization
+    'medium': [_EMAIL, _PHONE, _CREDIT_CARD],
+    # Aggressive sanitization
+    'high': [_EMAIL, _PHONE, _CREDIT_CARD, _SSN, _NAME, _ADDRESS],
+}
+
+# Sentence boundaries, as used by content search
+_SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+
+def index_sentences(content: str, content_lower: str) -> Dict[str, List]:
+    """Split content into sentences and record each one's [start, end) offsets in content_lower
+    
+    Lowercasing can change the length of a few characters, so the offsets only
+    index content_lower and the sentence text is kept alongside them.
+    """
+    boundaries = list(_SENTENCE_SPLIT_RE.finditer(content_lower))
+    return {
+        '_sentences': _SENTENCE_SPLIT_RE.split(content),
+        '_sentence_starts': [0] + [boundary.end() for boundary in boundaries],
+        '_sentence_ends': [boundary.start() for boundary in boundaries] + [len(content_lower)],
+    }
+
+# PDFs with at least this many pages have their text extracted across processes
+PARALLEL_PDF_PAGES = 32
+
+def _extract_pdf_pages(pdf_reader: "PyPDF2.PdfReader", start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) as page sections, skipping empty pages"""
+    parts = []
+    for page_num in range(start, stop):
+        page_text = pdf_reader.pages[page_num].extract_text()
+        if page_text:
+            parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
+    return parts
+
+def _extract_pdf_range(data: bytes, start: int, stop: int) -> List[str]:
+    """Worker-process entry point: parse the PDF and extract one range of pages"""
+    import PyPDF2
+    return _extract_pdf_pages(PyPDF2.PdfReader(io.BytesIO(data), strict=False), start, stop)
+
+def _extract_pdfium(data: bytes) -> Tuple[int, List[str]]:
+    """Extract page sections with PDFium's native text extraction"""
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(data)
+    try:
+        parts = []
+        for page_num in range(len(pdf)):
+            page = pdf[page_num]
+            textpage = page.get_textpage()
+            page_text = textpage.get_text_range().replace('\r\n', '\n')
+            textpage.close()
+            page.close()
+            if page_text:
+                parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
+        return len(pdf), parts
+    finally:
+        pdf.close()
+
 class DocumentProcessor:
     def __init__(self, enable_privacy: bool = True):
         self.enable_privacy = enable_privacy
-        self.supported_formats = ['pdf', 'docx', 'pptx']
+        # Extension -> extractor, so dispatch is a single dict lookup
+        self._extractors = {
+            'pdf': self._process_pdf,
+            'docx': self._process_docx,
+            'pptx': self._process_pptx,
+        }
+        self.supported_formats = list(self._extractors)
     
     def process_multiple_documents(self, uploaded_files: List[Any], sanitization_level: str = "medium") -> List[Dict[str, Any]]:
-        """Process multiple uploaded files"""
-        processed_documents = []
+        """Process multiple uploaded files, one worker process per file"""
+        # Plain bytes and names pickle cheaply; Streamlit's UploadedFile does not
+        datas = [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+        filenames = [uploaded_file.name for uploaded_file in uploaded_files]
+        workers = min(os.cpu_count() or 1, len(datas), 8)
         
-        for uploaded_file in uploaded_files:
-            try:
-                doc_data = self.process_document(uploaded_file, sanitization_level)
-                if doc_data:
-                    doc_data['filename'] = uploaded_file.name
-                    processed_documents.append(doc_data)
-            except Exception as e:
-                # Log error but continue with other documents
-                print(f"Error processing {uploaded_file.name}: {str(e)}")
-                continue
+        args = (repeat(self.enable_privacy), datas, filenames, repeat(sanitization_level))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_process_upload, *args))
+        else:
+            results = list(map(_process_upload, *args))
         
-        return processed_documents
+        return [doc_data for doc_data in results if doc_data]
     
-    def process_document(self, uploaded_file: Any, sanitization_level: str = "medium") -> Dict[str, Any]:
-        """Process a single document file"""
+    def process_document(self, data: bytes, filename: str, sanitization_level: str = "medium") -> Dict[str, Any]:
+        """Process a single document from its raw bytes; the extension of filename selects the format"""
         
         # Get file info
-        file_name = uploaded_file.name
-        file_extension = file_name.split('.')[-1].lower()
-        file_size = len(uploaded_file.getvalue())
+        file_extension = filename.split('.')[-1].lower()
+        file_size = len(data)
         
-        if file_extension not in self.supported_formats:
+        extractor = self._extractors.get(file_extension)
+        if extractor is None:
             raise ValueError(f"Unsupported file format: {file_extension}")
         
-        # Reset file pointer
-        uploaded_file.seek(0)
-        
         # Process based on file type
         document_data = {
-            'filename': file_name,
+            'filename': filename,
             'type': file_extension,
             'file_size': file_size,
             'processed_at': datetime.now().isoformat(),
@@ -55,12 +131,7 @@ class DocumentProcessor:
         }
         
         try:
-            if file_extension == 'pdf':
-                document_data.update(self._process_pdf(uploaded_file))
-            elif file_extension == 'docx':
-                document_data.update(self._process_docx(uploaded_file))
-            elif file_extension == 'pptx':
-                document_data.update(self._process_pptx(uploaded_file))
+            document_data.update(extractor(data))
             
             # Apply privacy sanitization if enabled
             if self.enable_privacy and sanitization_level != "none":
@@ -74,108 +145,99 @@ class DocumentProcessor:
             return document_data
             
         except Exception as e:
-            raise Exception(f"Error processing {file_name}: {str(e)}")
+            raise Exception(f"Error processing {filename}: {str(e)}")
     
-    def _process_pdf(self, uploaded_file) -> Dict[str, Any]:
+    def _process_pdf(self, data: bytes) -> Dict[str, Any]:
         """Extract content from PDF file"""
-        content = ""
-        pages = 0
-        
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
-            
-            # Read PDF
-            with open(tmp_file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                pages = len(pdf_reader.pages)
-                
-                for page_num in range(pages):
-                    page = pdf_reader.pages[page_num]
-                    page_text = page.extract_text()
-                    if page_text:
-                        content += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-            
-            # Clean up
-            os.unlink(tmp_file_path)
-            
+            if _HAS_PDFIUM:
+                # PDFium's C++ extractor is several times faster than PyPDF2
+                pages, parts = _extract_pdfium(data)
+            else:
+                pages, parts = self._extract_pypdf2(data)
         except Exception as e:
             raise Exception(f"PDF processing error: {str(e)}")
         
         return {
-            'content': content.strip(),
+            'content': ''.join(parts).strip(),
             'pages': pages,
             'metadata': {'total_pages': pages}
         }
     
-    def _process_docx(self, uploaded_file) -> Dict[str, Any]:
-        """Extract content from Word document"""
-        content = ""
-        paragraphs = []
+    def _extract_pypdf2(self, data: bytes) -> Tuple[int, List[str]]:
+        """Extract page sections with PyPDF2, across processes for large PDFs"""
+        import PyPDF2
+        
+        # Read PDF straight from memory
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(data), strict=False)
+        pages = len(pdf_reader.pages)
+        workers = min(os.cpu_count() or 1, 8)
+        
+        # PyPDF2 extraction is pure Python and holds the GIL, so large PDFs are
+        # split across processes; skip this when already inside a worker process
+        if pages >= PARALLEL_PDF_PAGES and workers > 1 and multiprocessing.parent_process() is None:
+            parts = self._extract_pdf_parallel(data, pages, workers)
+        else:
+            parts = _extract_pdf_pages(pdf_reader, 0, pages)
+        
+        return pages, parts
+    
+    def _extract_pdf_parallel(self, data: bytes, pages: int, workers: int) -> List[str]:
+        """Extract page sections with one contiguous page range per worker process"""
+        step = -(-pages // workers)
+        starts = range(0, pages, step)
+        stops = [min(start + step, pages) for start in starts]
         
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            ranges = executor.map(_extract_pdf_range, repeat(data), starts, stops)
+            return [part for range_parts in ranges for part in range_parts]
+    
+    def _process_docx(self, data: bytes) -> Dict[str, Any]:
+        """Extract content from Word document"""
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
-            
-            # Read DOCX
-            doc = docx.Document(tmp_file_path)
+            import docx
             
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    paragraphs.append(paragraph.text.strip())
-                    content += paragraph.text + "\n\n"
+            # Read DOCX straight from memory
+            doc = docx.Document(io.BytesIO(data))
             
-            # Clean up
-            os.unlink(tmp_file_path)
+            # paragraph.text is rebuilt from its runs on every access, so read it once
+            paragraphs = [text for paragraph in doc.paragraphs if (text := paragraph.text.strip())]
             
         except Exception as e:
             raise Exception(f"DOCX processing error: {str(e)}")
         
         return {
-            'content': content.strip(),
+            'content': '\n\n'.join(paragraphs),
             'paragraphs': paragraphs,
             'metadata': {'total_paragraphs': len(paragraphs)}
         }
     
-    def _process_pptx(self, uploaded_file) -> Dict[str, Any]:
+    def _process_pptx(self, data: bytes) -> Dict[str, Any]:
         """Extract content from PowerPoint presentation"""
-        content = ""
         slide_count = 0
         slides_content = []
         
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
+            from pptx import Presentation
             
-            # Read PPTX
-            prs = Presentation(tmp_file_path)
+            # Read PPTX straight from memory
+            prs = Presentation(io.BytesIO(data))
             slide_count = len(prs.slides)
             
             for slide_num, slide in enumerate(prs.slides):
-                slide_text = f"\n--- Slide {slide_num + 1} ---\n"
+                slide_parts = [f"\n--- Slide {slide_num + 1} ---\n"]
                 
                 for shape in slide.shapes:
                     if hasattr(shape, "text") and shape.text:
-                        slide_text += shape.text + "\n"
+                        slide_parts.append(shape.text + "\n")
                 
-                if slide_text.strip():
-                    slides_content.append(slide_text)
-                    content += slide_text + "\n"
-            
-            # Clean up
-            os.unlink(tmp_file_path)
+                slides_content.append(''.join(slide_parts))
             
         except Exception as e:
             raise Exception(f"PPTX processing error: {str(e)}")
         
         return {
-            'content': content.strip(),
+            'content': '\n'.join(slides_content).strip(),
             'slide_count': slide_count,
             'slides_content': slides_content,
             'metadata': {'total_slides': slide_count}
@@ -194,39 +256,10 @@ class DocumentProcessor:
             'addresses': 0
         }
         
-        if level == "low":
-            # Basic sanitization - only obvious patterns
-            patterns = [
-                (r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b', '[CREDIT_CARD]', 'credit_cards'),
-                (r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', '[PHONE]', 'phone_numbers'),
-            ]
-        
-        elif level == "medium":
-            # Standard sanitization
-            patterns = [
-                (r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL]', 'emails'),
-                (r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', '[PHONE]', 'phone_numbers'),
-                (r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b', '[CREDIT_CARD]', 'credit_cards'),
-            ]
-        
-        elif level == "high":
-            # Aggressive sanitization
-            patterns = [
-                (r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL]', 'emails'),
-                (r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', '[PHONE]', 'phone_numbers'),
-                (r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b', '[CREDIT_CARD]', 'credit_cards'),
-                (r'\b\d{3}[-.]?\d{2}[-.]?\d{4}\b', '[SSN]', 'ssns'),
-                (r'\b[A-Z][a-z]+ [A-Z][a-z]+\b', '[NAME]', 'names'),  # Simple name pattern
-                (r'\b\d+\s+[A-Za-z\s]+(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln)\b', '[ADDRESS]', 'addresses'),
-            ]
-        else:
-            patterns = []
-        
-        # Apply sanitization patterns
-        for pattern, replacement, category in patterns:
-            matches = re.findall(pattern, sanitized_content)
-            removed_items[category] = len(matches)
-            sanitized_content = re.sub(pattern, replacement, sanitized_content)
+        # Apply the level's sanitization patterns one at a time, in order, so an earlier
+        # (higher-priority) pattern always sees the whole text before a later one can claim part of it
+        for pattern, replacement, category in _SANITIZATION_PATTERNS.get(level, []):
+            sanitized_content, removed_items[category] = pattern.subn(replacement, sanitized_content)
         
         return {
             'content': sanitized_content,
@@ -261,3 +294,12 @@ class DocumentProcessor:
             'file_types': file_types,
             'average_words_per_doc': total_words // total_docs if total_docs > 0 else 0
         }
+
+def _process_upload(enable_privacy: bool, data: bytes, filename: str, sanitization_level: str) -> Optional[Dict[str, Any]]:
+    """Worker-process entry point for process_multiple_documents; returns None on failure"""
+    try:
+        return DocumentProcessor(enable_privacy=enable_privacy).process_document(data, filename, sanitization_level)
+    except Exception as e:
+        # Log error but continue with other documents
+        print(f"Error processing {filename}: {str(e)}")
+        return None
@@ -1,10 +1,68 @@
 # src/ollama_analyzer.py - Enhanced version
 import requests
+import hashlib
+import heapq
 import json
+import threading
+from bisect import bisect_right
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.document_processor import index_sentences
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 import re
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser is a drop-in fallback
+    _json_loads = json.loads
+
+# Runs of non-whitespace, i.e. what str.split() would return
+_WORD_RE = re.compile(r'\S+')
+
+# Numbered list parsing for themes and headlines
+_NUMBERED_RE = re.compile(r'^\d+\.\s*(.+)')
+_NUM_PREFIX_RE = re.compile(r'^\d+\.\s*')
+_DELIM_SPLIT_RE = re.compile(r'[;\n]')
+
+# Keyword in a sentiment response -> sentiment label, checked in order
+_SENTIMENTS = {
+    'positive': 'Positive',
+    'negative': 'Negative', 
+    'neutral': 'Neutral',
+    'mixed': 'Mixed',
+    'professional': 'Professional'
+}
+
+def create_session(pool_size: int = 10, retry_busy: bool = True) -> requests.Session:
+    """Keep-alive session for Ollama with a connection pool sized for concurrent calls
+    
+    Ollama answers 503 when its request queue is full, so that and gateway errors
+    are retried with backoff unless retry_busy is False. Connection failures are
+    not retried, so an offline server is still reported straight away.
+    """
+    if retry_busy:
+        retry = Retry(total=2, connect=0, read=0, status=2, backoff_factor=0.5,
+                      status_forcelist=(502, 503, 504), allowed_methods=None, raise_on_status=False)
+    else:
+        retry = 0
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@lru_cache(maxsize=16)
+def _search_index(content: str) -> Tuple[str, Dict[str, List]]:
+    """Lowercased text plus sentence split and offsets of a document, built on its first search and reused after"""
+    content_lower = content.lower()
+    return content_lower, index_sentences(content, content_lower)
+
 @dataclass
 class AnalysisResult:
     """Enhanced analysis result with additional metrics"""
@@ -16,38 +74,69 @@ class AnalysisResult:
     sentiment: str
     confidence_score: float = 0.0
     processing_time: float = 0.0
+    error: Optional[str] = None  # Set when the analysis failed and the fields hold placeholders
 
 class OllamaAnalyzer:
-    def __init__(self, model: str = "llama3.1", base_url: str = "http://localhost:11434"):
+    def __init__(self, model: str = "llama3.1", base_url: str = "http://localhost:11434",
+                 session: Optional[requests.Session] = None, num_ctx: int = 4096,
+                 num_batch: int = 512, keep_alive: str = "10m"):
         self.model = model
         self.base_url = base_url
-        self.session = requests.Session()
+        # Server-side tuning; num_ctx must fit the document prompt plus the combined JSON answer
+        self.num_ctx = num_ctx
+        self.num_batch = num_batch
+        self.keep_alive = keep_alive
+        # Callers may share one session (and its connection pool) across analyzers
+        self.session = session or create_session()
+        # Small LRU of finished analyses keyed by a hash of the document content
+        self._result_cache: "OrderedDict[str, AnalysisResult]" = OrderedDict()
+        self._result_cache_size = 32
+        self._result_cache_lock = threading.Lock()
     
-    def _make_request(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.3) -> str:
-        """Make request to Ollama API with optimized parameters"""
+    def _make_request(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.3,
+                      response_format: Optional[str] = None) -> str:
+        """Make request to Ollama API, accumulating the streamed response"""
+        return ''.join(self._stream_request(prompt, max_tokens, temperature, response_format)).strip()
+    
+    def _stream_request(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.3,
+                        response_format: Optional[str] = None) -> Iterator[str]:
+        """Stream a generation from the Ollama API with optimized parameters, yielding tokens as they arrive"""
         url = f"{self.base_url}/api/generate"
         
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": True,
+            # Keep the model (and its prompt cache) loaded between the section calls
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": temperature,
                 "top_p": 0.9,
                 "num_predict": max_tokens,
-                "num_ctx": 4096,
-                "num_batch": 8,
-                "num_threads": -1,
+                "num_ctx": self.num_ctx,
+                # Prompt tokens evaluated per step; large batches keep prefill on the GPU busy
+                "num_batch": self.num_batch,
             }
         }
+        if response_format:
+            payload["format"] = response_format
         
         try:
-            response = self.session.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result.get('response', '').strip()
-            
+            with self.session.post(url, json=payload, timeout=120, stream=True) as response:
+                response.raise_for_status()
+                
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = _json_loads(line)
+                    # A failure mid-generation (model unloaded, out of memory) arrives as an error line
+                    if chunk.get('error'):
+                        raise Exception(f"Ollama generation failed: {chunk['error']}")
+                    if chunk.get('response'):
+                        yield chunk['response']
+                    if chunk.get('done'):
+                        break
+                        
         except requests.exceptions.RequestException as e:
             raise Exception(f"Ollama API request failed: {str(e)}")
         except json.JSONDecodeError as e:
@@ -57,47 +146,113 @@ class OllamaAnalyzer:
         """Generate a response for chatbot functionality"""
         return self._make_request(prompt, max_tokens)
     
-    def analyze_document(self, document_data: Dict[str, Any]) -> AnalysisResult:
-        """Enhanced document analysis with better prompts and error handling"""
+    def _truncate_content(self, content: str) -> str:
+        """Truncate content if too long (keep first and last parts)"""
+        max_content_length = 3000
+        if len(content) > max_content_length:
+            half = max_content_length // 2
+            # Only the two kept ends are copied, joined in a single allocation
+            content = ''.join((content[:half], "\n\n[...content truncated...]\n\n", content[-half:]))
+        return content
+    
+    def _stream_sections(self, content: str) -> Iterator[Tuple[str, Any]]:
+        """Generate each analysis section in turn, streaming the summary token by token
+        
+        After the summary, the remaining sections are requested together as one
+        JSON object; if that reply can't be used, each is generated separately.
+        """
+        summary_parts = []
+        for token in self._stream_request(self._summary_prompt(content), max_tokens=500):
+            summary_parts.append(token)
+            yield 'summary_token', token
+        yield 'summary', ''.join(summary_parts).strip()
+        
+        # One request prefills the document once instead of once per section
+        sections = self._analyze_combined(content)
+        if sections is not None:
+            yield from sections.items()
+            return
+        
+        yield 'executive_summary', self._generate_executive_summary(content)
+        
+        key_themes = self._extract_key_themes(content)
+        yield 'key_themes', key_themes
+        
+        yield 'slide_headlines', self._generate_slide_headlines(content, key_themes)
+        
+        yield 'sentiment', self._analyze_sentiment(content)
+    
+    def analyze_document_streaming(self, document_data: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+        """Yield (section, value) pairs as each part of the analysis completes
+        
+        Summary tokens are yielded as ('summary_token', token) before the full
+        ('summary', text) pair; the other sections are yielded once generated.
+        """
         content = document_data.get('content', '')
         
         if not content:
             raise ValueError("Document content is empty")
         
-        # Calculate word count
-        word_count = len(content.split())
+        yield from self._stream_sections(self._truncate_content(content))
+    
+    def analyze_document(self, document_data: Dict[str, Any],
+                         on_update: Optional[Callable[[str, Any], None]] = None) -> AnalysisResult:
+        """Enhanced document analysis with better prompts and error handling
+        
+        If given, on_update is called with every (section, value) pair as it
+        becomes available, summary tokens included, so callers can show partial
+        results.
+        """
+        content = document_data.get('content', '')
         
-        # Truncate content if too long (keep first and last parts)
-        max_content_length = 3000
-        if len(content) > max_content_length:
-            content = content[:max_content_length//2] + "\n\n[...content truncated...]\n\n" + content[-max_content_length//2:]
+        if not content:
+            raise ValueError("Document content is empty")
+        
+        # Calculate word count without materializing the word list
+        word_count = sum(1 for _ in _WORD_RE.finditer(content))
+        
+        # Too little text to say anything useful about; skip the model entirely
+        if len(content.strip()) < 100:
+            return AnalysisResult(
+                summary="Document is too short to summarize.",
+                executive_summary="Document is too short to summarize.",
+                key_themes=["Not enough content"],
+                slide_headlines=["Not enough content"],
+                word_count=word_count,
+                sentiment="Neutral"
+            )
+        
+        cache_key = hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+        with self._result_cache_lock:
+            cached = self._result_cache.get(cache_key)
+            if cached is not None:
+                self._result_cache.move_to_end(cache_key)
+                return cached
         
         try:
-            # Generate summary
-            summary = self._generate_summary(content)
-            
-            # Generate executive summary
-            executive_summary = self._generate_executive_summary(content)
-            
-            # Extract key themes
-            key_themes = self._extract_key_themes(content)
+            sections = {}
+            for section, value in self.analyze_document_streaming(document_data):
+                sections[section] = value
+                if on_update:
+                    on_update(section, value)
             
-            # Generate slide headlines
-            slide_headlines = self._generate_slide_headlines(content, key_themes)
-            
-            # Analyze sentiment
-            sentiment = self._analyze_sentiment(content)
-            
-            return AnalysisResult(
-                summary=summary,
-                executive_summary=executive_summary,
-                key_themes=key_themes,
-                slide_headlines=slide_headlines,
+            result = AnalysisResult(
+                summary=sections['summary'],
+                executive_summary=sections['executive_summary'],
+                key_themes=sections['key_themes'],
+                slide_headlines=sections['slide_headlines'],
                 word_count=word_count,
-                sentiment=sentiment,
+                sentiment=sections['sentiment'],
                 confidence_score=0.85  # Default confidence
             )
             
+            # Only successful analyses are cached, so failures are retried
+            with self._result_cache_lock:
+                self._result_cache[cache_key] = result
+                if len(self._result_cache) > self._result_cache_size:
+                    self._result_cache.popitem(last=False)
+            return result
+            
         except Exception as e:
             # Return partial results if something fails
             return AnalysisResult(
@@ -106,40 +261,82 @@ class OllamaAnalyzer:
                 key_themes=["Error in theme extraction"],
                 slide_headlines=["Error in headline generation"],
                 word_count=word_count,
-                sentiment="Unknown"
+                sentiment="Unknown",
+                error=str(e)
             )
     
-    def _generate_summary(self, content: str) -> str:
-        """Generate document summary"""
-        prompt = f"""Please provide a comprehensive summary of the following document content. Focus on the main points, key findings, and important details. Keep it informative but concise.
-
-Document content:
+    def analyze_documents(self, documents: List[Dict[str, Any]], max_workers: int = 4) -> List[AnalysisResult]:
+        """Analyze several documents concurrently, returning results in input order
+        
+        Requests for different documents overlap instead of waiting on each other;
+        Ollama queues them, or runs them side by side when started with
+        OLLAMA_NUM_PARALLEL.
+        """
+        if len(documents) < 2:
+            return [self.analyze_document(document_data) for document_data in documents]
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(documents))) as executor:
+            return list(executor.map(self.analyze_document, documents))
+    
+    def _analyze_combined(self, content: str) -> Optional[Dict[str, Any]]:
+        """Generate every section but the summary with one JSON-mode request; returns None if the reply is unusable"""
+        prompt = self._document_prompt(content, """Analyze the document above and respond in JSON with these keys:
+- "executive_summary": a high-level overview for executives and decision-makers, focused on key insights, recommendations, and strategic implications
+- "key_themes": a list of 8 distinct, specific themes, topics, or concepts discussed
+- "slide_headlines": a list of 8 concise, engaging presentation slide headlines
+- "sentiment": one of Positive, Negative, Neutral, Mixed, or Professional""")
+        
+        try:
+            result = _json_loads(self._make_request(prompt, max_tokens=1200, response_format="json"))
+        except ValueError:  # json.JSONDecodeError and orjson.JSONDecodeError both subclass it
+            return None
+        
+        if not isinstance(result, dict):
+            return None
+        
+        def text_list(value: Any) -> List[str]:
+            return [str(item).strip() for item in value if str(item).strip()] if isinstance(value, list) else []
+        
+        sections = {
+            'executive_summary': str(result.get('executive_summary') or '').strip(),
+            'key_themes': text_list(result.get('key_themes'))[:8],
+            'slide_headlines': text_list(result.get('slide_headlines'))[:8],
+            'sentiment': self._normalize_sentiment(str(result.get('sentiment') or ''))
+        }
+        return sections if all(sections.values()) else None
+    
+    def _document_prompt(self, content: str, instructions: str) -> str:
+        """Put the document ahead of the instructions
+        
+        Every section prompt then starts with the same prefix, so Ollama can reuse
+        the already-evaluated document from its prompt cache instead of
+        re-prefilling it for each section.
+        """
+        return f"""Document content:
 {content}
 
-Summary:"""
-        
-        return self._make_request(prompt, max_tokens=500)
+{instructions}"""
+    
+    def _summary_prompt(self, content: str) -> str:
+        """Build the document summary prompt"""
+        return self._document_prompt(content, """Please provide a comprehensive summary of the document content above. Focus on the main points, key findings, and important details. Keep it informative but concise.
+
+Summary:""")
     
     def _generate_executive_summary(self, content: str) -> str:
         """Generate executive summary"""
-        prompt = f"""Create an executive summary of the following document. This should be a high-level overview suitable for executives and decision-makers. Focus on key insights, recommendations, and strategic implications.
+        prompt = self._document_prompt(content, """Create an executive summary of the document above. This should be a high-level overview suitable for executives and decision-makers. Focus on key insights, recommendations, and strategic implications.
 
-Document content:
-{content}
-
-Executive Summary:"""
+Executive Summary:""")
         
         return self._make_request(prompt, max_tokens=300)
     
     def _extract_key_themes(self, content: str) -> List[str]:
         """Extract key themes from document"""
-        prompt = f"""Analyze the following document and identify the key themes, topics, and concepts discussed. Return exactly 8 distinct themes as a numbered list. Each theme should be specific and meaningful.
-
-Document content:
-{content}
+        prompt = self._document_prompt(content, """Analyze the document above and identify the key themes, topics, and concepts discussed. Return exactly 8 distinct themes as a numbered list. Each theme should be specific and meaningful.
 
 Key themes (list 8 themes):
-1."""
+1.""")
         
         response = self._make_request(prompt, max_tokens=400)
         
@@ -149,7 +346,7 @@ Key themes (list 8 themes):
         
         for line in lines:
             # Look for numbered items (1. 2. etc.)
-            match = re.match(r'^\d+\.\s*(.+)', line.strip())
+            match = _NUMBERED_RE.match(line.strip())
             if match:
                 theme = match.group(1).strip()
                 if theme and len(theme) > 5:  # Filter out very short themes
@@ -158,10 +355,10 @@ Key themes (list 8 themes):
         # If parsing failed, try to extract themes differently
         if len(themes) < 3:
             # Split by common delimiters and clean up
-            potential_themes = re.split(r'[;\n]', response)
+            potential_themes = _DELIM_SPLIT_RE.split(response)
             themes = []
             for theme in potential_themes:
-                theme = re.sub(r'^\d+\.\s*', '', theme.strip())  # Remove numbering
+                theme = _NUM_PREFIX_RE.sub('', theme.strip())  # Remove numbering
                 if theme and len(theme) > 5:
                     themes.append(theme)
         
@@ -171,16 +368,13 @@ Key themes (list 8 themes):
         """Generate presentation slide headlines"""
         themes_str = '\n'.join([f"- {theme}" for theme in themes[:5]])
         
-        prompt = f"""Based on the following document content and key themes, create 8 compelling presentation slide headlines. Each headline should be concise, engaging, and capture a key aspect of the content.
-
-Document content:
-{content}
-
-Key themes identified:
+        prompt = self._document_prompt(content, f"""Key themes identified:
 {themes_str}
 
+Based on the document content above and these key themes, create 8 compelling presentation slide headlines. Each headline should be concise, engaging, and capture a key aspect of the content.
+
 Generate 8 slide headlines:
-1."""
+1.""")
         
         response = self._make_request(prompt, max_tokens=400)
         
@@ -189,7 +383,7 @@ Generate 8 slide headlines:
         lines = response.split('\n')
         
         for line in lines:
-            match = re.match(r'^\d+\.\s*(.+)', line.strip())
+            match = _NUMBERED_RE.match(line.strip())
             if match:
                 headline = match.group(1).strip()
                 if headline:
@@ -201,7 +395,8 @@ Generate 8 slide headlines:
         """Analyze document sentiment"""
         # For longer content, sample from different parts
         if len(content) > 1000:
-            sample_content = content[:300] + content[len(content)//2:len(content)//2+300] + content[-300:]
+            mid = len(content) // 2
+            sample_content = ''.join((content[:300], content[mid:mid + 300], content[-300:]))
         else:
             sample_content = content
         
@@ -212,19 +407,15 @@ Content to analyze:
 
 Sentiment classification:"""
         
-        response = self._make_request(prompt, max_tokens=50, temperature=0.1)
-        
-        # Clean up response and return appropriate sentiment
-        sentiment_keywords = {
-            'positive': 'Positive',
-            'negative': 'Negative', 
-            'neutral': 'Neutral',
-            'mixed': 'Mixed',
-            'professional': 'Professional'
-        }
+        # The answer is a single label, so a short generation budget is enough
+        response = self._make_request(prompt, max_tokens=20, temperature=0.1)
         
+        return self._normalize_sentiment(response)
+    
+    def _normalize_sentiment(self, response: str) -> str:
+        """Map a free-text sentiment response onto one of the sentiment labels"""
         response_lower = response.lower()
-        for keyword, sentiment in sentiment_keywords.items():
+        for keyword, sentiment in _SENTIMENTS.items():
             if keyword in response_lower:
                 return sentiment
         
@@ -232,38 +423,61 @@ Sentiment classification:"""
     
     def search_document_content(self, documents: List[Dict], query: str) -> List[Dict]:
         """Search for content across multiple documents"""
-        results = []
-        query_lower = query.lower()
+        matches = []
+        query_words = query.lower().split()
+        if not query_words:
+            return []
+        
+        # Find every query word in one scan per document: a zero-width lookahead over the
+        # alternation reports overlapping occurrences, longest word first at each offset
+        distinct_words = sorted(set(query_words), key=len, reverse=True)
+        word_pattern = re.compile('(?=(' + '|'.join(map(re.escape, distinct_words)) + '))')
+        # Shorter query words that start at the same offset as a match are found too
+        prefix_words = {word: [w for w in distinct_words if word.startswith(w)] for word in distinct_words}
+        # Repeated query words count once per repetition
+        word_weights = Counter(query_words)
         
         for doc in documents:
             content = doc.get('content', '')
             if not content:
                 continue
             
-            # Split into sentences
-            sentences = re.split(r'[.!?]+', content)
+            # Lowercased text, sentences, and where each sentence starts and ends
+            content_lower, sentence_index = _search_index(content)
+            sentences = sentence_index['_sentences']
+            starts = sentence_index['_sentence_starts']
+            ends = sentence_index['_sentence_ends']
+            
+            # Bucket word hits into the sentences that contain them
+            found: Dict[int, set] = {}
+            for hit in word_pattern.finditer(content_lower):
+                offset = hit.start()
+                index = bisect_right(starts, offset) - 1
+                for word in prefix_words[hit.group(1)]:
+                    if offset + len(word) <= ends[index]:
+                        found.setdefault(index, set()).add(word)
             
-            for sentence in sentences:
-                sentence = sentence.strip()
+            for index in sorted(found):
+                sentence = sentences[index].strip()
                 if len(sentence) < 20:  # Skip very short sentences
                     continue
                 
                 # Calculate relevance score
-                sentence_lower = sentence.lower()
-                query_words = query_lower.split()
-                relevance = sum(1 for word in query_words if word in sentence_lower)
-                
-                if relevance > 0:
-                    results.append({
-                        'document': doc.get('filename', 'Unknown'),
-                        'content': sentence,
-                        'relevance_score': relevance / len(query_words),
-                        'context': self._get_sentence_context(content, sentence)
-                    })
-        
-        # Sort by relevance
-        results.sort(key=lambda x: x['relevance_score'], reverse=True)
-        return results[:10]
+                relevance = sum(word_weights[word] for word in found[index])
+                matches.append((relevance / len(query_words), doc.get('filename', 'Unknown'), sentence, content))
+        
+        # Select the top 10 by relevance without sorting every match, and only
+        # build context for the sentences that are actually returned
+        top_matches = heapq.nlargest(10, matches, key=lambda m: m[0])
+        return [
+            {
+                'document': filename,
+                'content': sentence,
+                'relevance_score': relevance_score,
+                'context': self._get_sentence_context(content, sentence)
+            }
+            for relevance_score, filename, sentence, content in top_matches
+        ]
     
     def _get_sentence_context(self, full_content: str, target_sentence: str) -> str:
         """Get context around a sentence"""
@@ -277,15 +491,12 @@ Sentiment classification:"""
             context_start = max(0, sentence_start - 200)
             context_end = min(len(full_content), sentence_start + len(target_sentence) + 200)
             
-            context = full_content[context_start:context_end]
-            
-            # Clean up context
-            if context_start > 0:
-                context = "..." + context
-            if context_end < len(full_content):
-                context = context + "..."
-            
-            return context
+            # Mark truncated ends, slicing and joining once rather than re-copying the context
+            return ''.join((
+                "..." if context_start > 0 else "",
+                full_content[context_start:context_end],
+                "..." if context_end < len(full_content) else ""
+            ))
         except:
             return target_sentence
     
@@ -315,19 +526,20 @@ Comparative Analysis:"""
         """Answer questions about the documents with conversation context"""
         
         # Create document context
-        doc_context = "Available documents:\n"
-        for i, doc in enumerate(documents):
-            doc_context += f"\nDocument {i+1}: {doc.get('filename', 'Unknown')}\n"
-            doc_context += f"Content preview: {doc.get('content', '')[:800]}...\n"
-            doc_context += "---\n"
+        doc_context = "Available documents:\n" + "".join(
+            f"\nDocument {i+1}: {doc.get('filename', 'Unknown')}\n"
+            f"Content preview: {doc.get('content', '')[:800]}...\n"
+            "---\n"
+            for i, doc in enumerate(documents)
+        )
         
         # Add conversation history if available
         context_prompt = ""
         if conversation_history:
             recent_history = conversation_history[-4:]  # Last 4 exchanges
-            context_prompt = "\nRecent conversation:\n"
-            for msg in recent_history:
-                context_prompt += f"{msg['role']}: {msg['content']}\n"
+            context_prompt = "\nRecent conversation:\n" + "".join(
+                f"{msg['role']}: {msg['content']}\n" for msg in recent_history
+            )
         
         prompt = f"""You are an AI assistant helping analyze uploaded documents. Use the document content to answer the user's question accurately and helpfully.
 
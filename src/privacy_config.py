@@ -1,8 +1,13 @@
 import streamlit as st
 from typing import Dict, List
+import copy
 import json
+import os
 from pathlib import Path
 
+# Last parsed config file as (path, mtime_ns, size, config)
+_config_cache = None
+
 class PrivacyConfig:
     """Advanced privacy configuration management"""
     
@@ -12,11 +17,16 @@ class PrivacyConfig:
         self.load_config()
     
     def load_config(self):
-        """Load privacy configuration from file"""
+        """Load privacy configuration from file, reusing the last parse while the file is unchanged"""
+        global _config_cache
         try:
             if self.config_file.exists():
-                with open(self.config_file, 'r') as f:
-                    self.config = json.load(f)
+                stat = self.config_file.stat()
+                key = (self.config_file, stat.st_mtime_ns, stat.st_size)
+                if _config_cache is None or _config_cache[:3] != key:
+                    _config_cache = key + (json.loads(self.config_file.read_bytes()),)
+                # The settings widgets edit self.config in place, so hand out a copy
+                self.config = copy.deepcopy(_config_cache[3])
             else:
                 self.config = self.get_default_config()
         except Exception as e:
@@ -53,8 +63,11 @@ class PrivacyConfig:
     def save_config(self):
         """Save current configuration"""
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
+            # Encode first so the file is written in one call rather than token by token,
+            # then rename it into place so a concurrent load never reads a partial file
+            tmp_file = self.config_file.with_name(self.config_file.name + '.tmp')
+            tmp_file.write_text(json.dumps(self.config, indent=2))
+            os.replace(tmp_file, self.config_file)
         except Exception as e:
             st.error(f"Could not save privacy config: {e}")
     
@@ -2,12 +2,92 @@
 import os
 import json
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Any
 import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json module is the fallback
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; files are stored uncompressed without it
+    zstandard = None
+
+# Suffixes of stored analysis/session files, plain and zstd-compressed
+_STORED_SUFFIXES = ('.json', '.json.zst')
+
+def _dump_json(data: Any) -> bytes:
+    """Serialize to indented UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def _load_json(data: bytes) -> Any:
+    """Parse UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _read_stored(path: Path) -> Any:
+    """Read a stored JSON file, decompressing .zst files"""
+    data = path.read_bytes()
+    if path.suffix == '.zst':
+        if zstandard is None:
+            raise Exception(f"zstandard is required to read {path.name}")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return _load_json(data)
+
+# Fields kept from a saved analysis for the history listing; the bulky
+# summary/headline payloads stay on disk
+_HISTORY_FIELDS = ('filename', 'timestamp', 'word_count', 'key_themes', 'sentiment', 'privacy_protected')
+
+# Parsed history entries keyed by file path, with the (mtime_ns, size) they were read at
+_HISTORY_ENTRIES: Dict[str, tuple] = {}
+
+def _project_analysis(data: Dict) -> Dict:
+    """History entry for a single saved analysis"""
+    return {field: data[field] for field in _HISTORY_FIELDS if field in data}
+
+def _project_session(data: Dict) -> Dict:
+    """History entry for a multi-document session"""
+    return {
+        'session_id': data.get('session_id'),
+        'timestamp': data.get('created_at'),
+        'document_count': data.get('document_count', 0),
+        'type': 'multi_document_session'
+    }
+
+# Threads used to parse history files that are not memoized yet
+HISTORY_WORKERS = 8
+
+def _parse_history_entry(item: tuple) -> Dict:
+    """Parse one stored file into its history entry; None if it cannot be read"""
+    path, project, _ = item
+    try:
+        return project(_read_stored(path))
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return None
+
+@lru_cache(maxsize=16)
+def _scan_stored(directory: str, prefix: str, mtime_ns: int) -> tuple:
+    """Names of the stored JSON files in a directory; mtime_ns keys the cache so any add/remove rescans"""
+    with os.scandir(directory) as entries:
+        return tuple(entry.name for entry in entries
+                     if entry.name.startswith(prefix) and entry.name.endswith(_STORED_SUFFIXES))
 
 class PrivacyManager:
-    def __init__(self):
+    def __init__(self, compress_storage: bool = False, max_stored_analyses: int = None):
+        # Compression needs the optional zstandard package
+        self.compress_storage = compress_storage and zstandard is not None
+        # Oldest files beyond this many per directory are deleted on save; None keeps everything
+        self.max_stored_analyses = max_stored_analyses
         self.base_dir = Path.home() / '.document_analyzer'
         self.analyses_dir = self.base_dir / 'analyses'
         self.sessions_dir = self.base_dir / 'sessions'
@@ -18,12 +98,13 @@ class PrivacyManager:
     
     def save_analysis_locally(self, analysis_results: List[Dict], session_id: str = None) -> str:
         """Save multiple document analyses locally"""
+        now = datetime.now()
         if not session_id:
-            session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+            session_id = now.strftime("%Y%m%d_%H%M%S")
         
         session_data = {
             'session_id': session_id,
-            'created_at': datetime.now().isoformat(),
+            'created_at': now.isoformat(),
             'document_count': len(analysis_results),
             'analyses': analysis_results,
             'privacy_guaranteed': True
@@ -33,8 +114,8 @@ class PrivacyManager:
         session_file = self.sessions_dir / f"session_{session_id}.json"
         
         try:
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(session_data, f, indent=2, ensure_ascii=False)
+            session_file = self._write_stored(session_file, session_data)
+            self._prune_stored(self.sessions_dir, "session_")
             
             return str(session_file)
         except Exception as e:
@@ -43,9 +124,10 @@ class PrivacyManager:
     
     def save_single_analysis(self, analysis, filename: str, sanitization_info: Dict = None) -> str:
         """Save analysis for a single document (backward compatibility)"""
+        now = datetime.now()
         analysis_data = {
             'filename': filename,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
             'summary': getattr(analysis, 'summary', ''),
             'executive_summary': getattr(analysis, 'executive_summary', ''),
             'key_themes': getattr(analysis, 'key_themes', []),
@@ -57,49 +139,106 @@ class PrivacyManager:
         }
         
         # Generate unique filename based on content hash
-        content_hash = hashlib.md5(filename.encode()).hexdigest()[:8]
-        analysis_file = self.analyses_dir / f"analysis_{content_hash}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        content_hash = hashlib.blake2b(filename.encode(), digest_size=4).hexdigest()
+        analysis_file = self.analyses_dir / f"analysis_{content_hash}_{now.strftime('%Y%m%d_%H%M%S')}.json"
         
         try:
-            with open(analysis_file, 'w', encoding='utf-8') as f:
-                json.dump(analysis_data, f, indent=2, ensure_ascii=False)
+            analysis_file = self._write_stored(analysis_file, analysis_data)
+            self._prune_stored(self.analyses_dir, "analysis_")
             
             return str(analysis_file)
         except Exception as e:
             print(f"Error saving analysis: {e}")
             return None
     
+    def _write_stored(self, path: Path, data: Any) -> Path:
+        """Atomically write a JSON file, zstd-compressed to path.zst when compress_storage is on"""
+        payload = _dump_json(data)
+        if self.compress_storage:
+            path = path.with_name(path.name + '.zst')
+            payload = zstandard.ZstdCompressor(level=3).compress(payload)
+        # Write beside the target and rename over it, so readers never see a partial file
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+        return path
+    
+    def _prune_stored(self, directory: Path, prefix: str) -> int:
+        """Delete the oldest stored files beyond max_stored_analyses"""
+        if not self.max_stored_analyses:
+            return 0
+        
+        try:
+            with os.scandir(directory) as it:
+                entries = [entry for entry in it
+                           if entry.name.startswith(prefix) and entry.name.endswith(_STORED_SUFFIXES)]
+            excess = len(entries) - self.max_stored_analyses
+            if excess <= 0:
+                return 0
+            # Only the excess oldest files are needed, not a full sort
+            oldest = heapq.nsmallest(excess, entries, key=lambda e: e.stat(follow_symlinks=False).st_mtime_ns)
+        except OSError as e:
+            print(f"Error pruning {directory}: {e}")
+            return 0
+        
+        removed = 0
+        for entry in oldest:
+            try:
+                os.unlink(entry.path)
+                removed += 1
+            except OSError as e:
+                print(f"Error deleting {entry.path}: {e}")
+        return removed
+    
+    def storage_version(self) -> tuple:
+        """Modification times of the storage directories; changes whenever an analysis or session file is added or removed"""
+        return (self.analyses_dir.stat().st_mtime_ns, self.sessions_dir.stat().st_mtime_ns)
+    
+    def _list_stored(self, directory: Path, prefix: str) -> List[Path]:
+        """Stored files matching prefix*.json[.zst], listed once per directory change"""
+        try:
+            names = _scan_stored(str(directory), prefix, directory.stat().st_mtime_ns)
+        except FileNotFoundError:
+            return []
+        return [directory / name for name in names]
+    
     def load_analysis_history(self) -> List[Dict]:
         """Load analysis history from local storage"""
         history = []
+        stored = ([(path, _project_analysis) for path in self._list_stored(self.analyses_dir, "analysis_")] +
+                  [(path, _project_session) for path in self._list_stored(self.sessions_dir, "session_")])
         
-        # Load individual analyses
-        if self.analyses_dir.exists():
-            for analysis_file in self.analyses_dir.glob("analysis_*.json"):
-                try:
-                    with open(analysis_file, 'r', encoding='utf-8') as f:
-                        analysis_data = json.load(f)
-                        history.append(analysis_data)
-                except Exception as e:
-                    print(f"Error loading {analysis_file}: {e}")
-                    continue
+        # Reuse entries whose file is unchanged since it was last parsed
+        pending = []
+        for path, project in stored:
+            try:
+                stat = path.stat()
+            except OSError as e:
+                print(f"Error loading {path}: {e}")
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = _HISTORY_ENTRIES.get(str(path))
+            if cached is not None and cached[0] == signature:
+                history.append(dict(cached[1]))
+            else:
+                pending.append((path, project, signature))
         
-        # Load session analyses
-        if self.sessions_dir.exists():
-            for session_file in self.sessions_dir.glob("session_*.json"):
-                try:
-                    with open(session_file, 'r', encoding='utf-8') as f:
-                        session_data = json.load(f)
-                        # Add session info to history
-                        history.append({
-                            'session_id': session_data.get('session_id'),
-                            'timestamp': session_data.get('created_at'),
-                            'document_count': session_data.get('document_count', 0),
-                            'type': 'multi_document_session'
-                        })
-                except Exception as e:
-                    print(f"Error loading {session_file}: {e}")
-                    continue
+        # Parse new or changed files; reads release the GIL, so a cold load overlaps them
+        if len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=min(HISTORY_WORKERS, len(pending))) as pool:
+                parsed = list(pool.map(_parse_history_entry, pending))
+        else:
+            parsed = [_parse_history_entry(item) for item in pending]
+        
+        for (path, _, signature), entry in zip(pending, parsed):
+            if entry is not None:
+                _HISTORY_ENTRIES[str(path)] = (signature, entry)
+                history.append(dict(entry))
+        
+        # Forget entries for files that have been deleted
+        seen = {str(path) for path, _ in stored}
+        for stale in [path for path in _HISTORY_ENTRIES if path not in seen]:
+            _HISTORY_ENTRIES.pop(stale, None)
         
         # Sort by timestamp (newest first)
         history.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
@@ -107,46 +246,47 @@ class PrivacyManager:
     
     def load_session_data(self, session_id: str) -> Dict:
         """Load specific session data"""
-        session_file = self.sessions_dir / f"session_{session_id}.json"
-        
-        if session_file.exists():
-            try:
-                with open(session_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading session {session_id}: {e}")
+        for suffix in _STORED_SUFFIXES:
+            session_file = self.sessions_dir / f"session_{session_id}{suffix}"
+            if session_file.exists():
+                try:
+                    return _read_stored(session_file)
+                except Exception as e:
+                    print(f"Error loading session {session_id}: {e}")
         
         return {}
     
     def get_privacy_report(self, sanitization_info: Dict = None) -> str:
         """Generate privacy protection report"""
-        report = "🔒 **Privacy Protection Report**\n\n"
-        
-        report += "✅ **Guaranteed Privacy Features:**\n"
-        report += "• All processing performed locally on your computer\n"
-        report += "• No data transmission to external servers\n"
-        report += "• Automatic temporary file cleanup\n"
-        report += "• Memory cleared after processing\n"
-        report += "• Results stored locally only\n\n"
+        parts = [
+            "🔒 **Privacy Protection Report**\n\n",
+            "✅ **Guaranteed Privacy Features:**\n",
+            "• All processing performed locally on your computer\n",
+            "• No data transmission to external servers\n",
+            "• Automatic temporary file cleanup\n",
+            "• Memory cleared after processing\n",
+            "• Results stored locally only\n\n",
+        ]
         
         if sanitization_info:
-            report += "🛡️ **Document Sanitization Applied:**\n"
-            report += f"• Level: {sanitization_info.get('sanitization_level', 'Unknown').title()}\n"
-            report += f"• Original length: {sanitization_info.get('original_length', 0):,} characters\n"
-            report += f"• Processed length: {sanitization_info.get('sanitized_length', 0):,} characters\n"
+            parts.extend([
+                "🛡️ **Document Sanitization Applied:**\n",
+                f"• Level: {sanitization_info.get('sanitization_level', 'Unknown').title()}\n",
+                f"• Original length: {sanitization_info.get('original_length', 0):,} characters\n",
+                f"• Processed length: {sanitization_info.get('sanitized_length', 0):,} characters\n",
+            ])
             
             removed_items = sanitization_info.get('removed_items', {})
             total_removed = sum(removed_items.values())
             
             if total_removed > 0:
-                report += f"• Total sensitive items removed: {total_removed}\n"
-                for item_type, count in removed_items.items():
-                    if count > 0:
-                        report += f"  - {item_type.replace('_', ' ').title()}: {count}\n"
+                parts.append(f"• Total sensitive items removed: {total_removed}\n")
+                parts.extend(f"  - {item_type.replace('_', ' ').title()}: {count}\n"
+                             for item_type, count in removed_items.items() if count > 0)
             else:
-                report += "• No sensitive patterns detected\n"
+                parts.append("• No sensitive patterns detected\n")
         
-        return report
+        return "".join(parts)
     
     def export_privacy_settings(self) -> Dict:
         """Export privacy settings and statistics"""
@@ -160,8 +300,8 @@ class PrivacyManager:
         }
         
         # Add usage statistics
-        total_analyses = len(list(self.analyses_dir.glob("analysis_*.json")))
-        total_sessions = len(list(self.sessions_dir.glob("session_*.json")))
+        total_analyses = len(self._list_stored(self.analyses_dir, "analysis_"))
+        total_sessions = len(self._list_stored(self.sessions_dir, "session_"))
         
         settings['usage_stats'] = {
             'total_individual_analyses': total_analyses,
@@ -176,23 +316,21 @@ class PrivacyManager:
         cutoff_timestamp = datetime.now().timestamp() - (days_old * 24 * 3600)
         cleaned_count = 0
         
-        # Clean up individual analyses
-        for analysis_file in self.analyses_dir.glob("analysis_*.json"):
-            if analysis_file.stat().st_mtime < cutoff_timestamp:
-                try:
-                    analysis_file.unlink()
-                    cleaned_count += 1
-                except Exception as e:
-                    print(f"Error deleting {analysis_file}: {e}")
-        
-        # Clean up old sessions
-        for session_file in self.sessions_dir.glob("session_*.json"):
-            if session_file.stat().st_mtime < cutoff_timestamp:
-                try:
-                    session_file.unlink()
-                    cleaned_count += 1
-                except Exception as e:
-                    print(f"Error deleting {session_file}: {e}")
+        # Clean up individual analyses and old sessions
+        for directory, prefix in ((self.analyses_dir, "analysis_"), (self.sessions_dir, "session_")):
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if not (entry.name.startswith(prefix) and entry.name.endswith(_STORED_SUFFIXES)):
+                            continue
+                        try:
+                            if entry.stat(follow_symlinks=False).st_mtime < cutoff_timestamp:
+                                os.unlink(entry.path)
+                                cleaned_count += 1
+                        except OSError as e:
+                            print(f"Error deleting {entry.path}: {e}")
+            except FileNotFoundError:
+                continue
         
         return cleaned_count
     
@@ -201,8 +339,8 @@ class PrivacyManager:
         stats = {
             'base_directory': str(self.base_dir),
             'total_size_mb': self._get_directory_size(self.base_dir) / (1024 * 1024),
-            'individual_analyses': len(list(self.analyses_dir.glob("analysis_*.json"))),
-            'multi_document_sessions': len(list(self.sessions_dir.glob("session_*.json"))),
+            'individual_analyses': len(self._list_stored(self.analyses_dir, "analysis_")),
+            'multi_document_sessions': len(self._list_stored(self.sessions_dir, "session_")),
             'last_cleanup': 'Never',  # Could be enhanced to track cleanup history
         }
         
@@ -212,13 +350,18 @@ class PrivacyManager:
         """Calculate total size of directory"""
         total_size = 0
         
-        if directory.exists():
-            for file_path in directory.rglob('*'):
-                if file_path.is_file():
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
                     try:
-                        total_size += file_path.stat().st_size
-                    except (OSError, FileNotFoundError):
+                        if entry.is_file(follow_symlinks=False):
+                            total_size += entry.stat(follow_symlinks=False).st_size
+                        elif entry.is_dir(follow_symlinks=False):
+                            total_size += self._get_directory_size(entry.path)
+                    except OSError:
                         continue
+        except OSError:
+            pass
         
         return total_size
     
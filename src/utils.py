@@ -3,6 +3,18 @@ import json
 from typing import Dict, Any
 import hashlib
 
+from src.document_processor import DocumentProcessor
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json module is the fallback
+    orjson = None
+
+try:
+    import blake3
+except ImportError:  # blake3 is optional; hashlib's BLAKE2b is the fallback
+    blake3 = None
+
 def save_analysis_results(analysis_result, filename: str):
     """Save analysis results to JSON file"""
     try:
@@ -17,7 +29,10 @@ def save_analysis_results(analysis_result, filename: str):
         }
         
         # Create download button
-        json_string = json.dumps(results_dict, indent=2)
+        if orjson is not None:
+            json_string = orjson.dumps(results_dict, option=orjson.OPT_INDENT_2)
+        else:
+            json_string = json.dumps(results_dict, indent=2)
         st.download_button(
             label="💾 Download Analysis Results",
             data=json_string,
@@ -29,12 +44,17 @@ def save_analysis_results(analysis_result, filename: str):
         st.error(f"Error saving results: {str(e)}")
 
 def generate_file_hash(file_content: bytes) -> str:
-    """Generate hash for file content to check for duplicates"""
-    return hashlib.md5(file_content).hexdigest()
+    """Generate hash for file content to check for duplicates (BLAKE3 if installed, else BLAKE2b)"""
+    if blake3 is not None:
+        return blake3.blake3(file_content).hexdigest(length=16)
+    return hashlib.blake2b(file_content, digest_size=16).hexdigest()
+
+@st.cache_resource
+def _document_processor() -> DocumentProcessor:
+    """Shared document processor, built once per process"""
+    return DocumentProcessor(enable_privacy=True)
 
-@st.cache_data
-def cached_document_processing(file_hash: str, file_content: bytes, filename: str):
-    """Cache document processing results"""
-    # This function would be called by the document processor
-    # to cache results and avoid reprocessing the same file
-    pass
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_document_processing(file_hash: str, _file_content: bytes, filename: str, sanitization_level: str = "medium"):
+    """Cache document processing results, keyed on the content hash rather than the raw bytes"""
+    return _document_processor().process_document(bytes(_file_content), filename, sanitization_level)
@@ -0,0 +1,44 @@
+# tests/test_ai_analyzer.py - Combined JSON analysis parsing tests
+import importlib.util
+import json
+import unittest
+from unittest import mock
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ('streamlit', 'requests'))
+
+
+@unittest.skipUnless(HAS_DEPS, "streamlit and requests are required")
+class AnalyzeAllTest(unittest.TestCase):
+    def setUp(self):
+        from src.ai_analyzer import OllamaAnalyzer
+        self.analyzer = OllamaAnalyzer(session=mock.Mock())
+
+    def analyze_all(self, reply):
+        with mock.patch.object(self.analyzer, 'generate_response', return_value=json.dumps(reply)):
+            return self.analyzer.analyze_all("Some document text")
+
+    def reply(self, **overrides):
+        reply = {
+            'summary': "Summary",
+            'executive_summary': "Executive summary",
+            'key_themes': ["Growth", "Costs"],
+            'slide_headlines': ["Headline one", "Headline two"],
+            'sentiment': "Positive",
+        }
+        reply.update(overrides)
+        return reply
+
+    def test_list_values_are_used(self):
+        result = self.analyze_all(self.reply())
+        self.assertEqual(result['key_themes'], ["Growth", "Costs"])
+        self.assertEqual(result['slide_headlines'], ["Headline one", "Headline two"])
+
+    def test_string_themes_fall_back(self):
+        self.assertIsNone(self.analyze_all(self.reply(key_themes="Growth")))
+
+    def test_number_headlines_fall_back(self):
+        self.assertIsNone(self.analyze_all(self.reply(slide_headlines=6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# tests/test_document_processor.py - Sanitization regression tests
+import unittest
+
+from src.document_processor import DocumentProcessor
+
+
+class SanitizeContentTest(unittest.TestCase):
+    def setUp(self):
+        self.processor = DocumentProcessor(enable_privacy=True)
+
+    def sanitize(self, content, level):
+        return self.processor._sanitize_content(content, level)
+
+    def test_name_heuristic_does_not_leak_email_domain(self):
+        result = self.sanitize("John Smith@example.com", "high")
+        self.assertEqual(result['content'], "John [EMAIL]")
+        self.assertEqual(result['info']['removed_items']['emails'], 1)
+        self.assertEqual(result['info']['removed_items']['names'], 0)
+
+    def test_card_is_redacted_before_adjacent_phone_at_low_level(self):
+        result = self.sanitize("555-123-4567 4567 8901 2345 6789", "low")
+        self.assertEqual(result['content'], "555-123-[CREDIT_CARD] 6789")
+
+    def test_card_is_redacted_next_to_ssn_at_high_level(self):
+        result = self.sanitize("123-45-6789-4567 8901 2345 6789", "high")
+        self.assertEqual(result['content'], "123-45-[CREDIT_CARD] 6789")
+
+    def test_names_are_matched_before_addresses(self):
+        result = self.sanitize("We sold 3 units to John Smith on Main Street", "high")
+        self.assertEqual(result['content'], "We sold 3 units to [NAME] on [NAME]")
+        self.assertEqual(result['info']['removed_items']['names'], 2)
+        self.assertEqual(result['info']['removed_items']['addresses'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()